@@ -1,4 +1,8 @@
 from .controller import Controller
+from . import addrmap
+from . import descriptors
 from . import events
+from . import identity
 from . import onions
+from . import recorder
 from . import textprotocol
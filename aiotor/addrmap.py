@@ -0,0 +1,96 @@
+from datetime import datetime, timezone
+import heapq
+import time
+
+class AddressMap:
+
+    def __init__(self, controller):
+        self.controller = controller
+        # hostname -> (destination, expires timestamp or None)
+        self.__map = {}
+        # (expires, hostname) min-heap, stale entries are skipped lazily
+        self.__heap = []
+
+    async def start(self):
+        ''' keep map current by listening for ADDRMAP events '''
+        await self.controller.events.add('ADDRMAP', self.__addrmap)
+
+    async def stop(self):
+        ''' stop listening for ADDRMAP events '''
+        await self.controller.events.remove('ADDRMAP', self.__addrmap)
+
+    def __len__(self):
+        return len(self.__map)
+
+    def __contains__(self, hostname):
+        return self.get(hostname) is not None
+
+    def get(self, hostname, default=None):
+        ''' return current destination for hostname '''
+        entry = self.__map.get(hostname)
+        if entry is None:
+            return default
+        destination, expires = entry
+        if expires is not None and expires <= time.time():
+            return default
+        return destination
+
+    def set(self, hostname, destination, expires=None):
+        ''' store mapping, expires is a unix timestamp (None for never) '''
+        if hostname == destination:
+            # MAPADDRESS x=x removes the mapping for x
+            self.remove(hostname)
+            return
+        self.__map[hostname] = (destination, expires)
+        if expires is not None:
+            heapq.heappush(self.__heap, (expires, hostname))
+            if len(self.__heap) > 2 * len(self.__map) + 64:
+                self.__compact()
+
+    def update(self, mapping, expires=None):
+        ''' store every hostname -> destination pair in mapping '''
+        for hostname, destination in mapping.items():
+            self.set(hostname, destination, expires)
+
+    def remove(self, hostname):
+        ''' remove mapping for hostname (if any) '''
+        self.__map.pop(hostname, None)
+
+    def expire(self, now=None):
+        ''' remove expired mappings and return their hostnames '''
+        if now is None:
+            now = time.time()
+        heap = self.__heap
+        expired = []
+        while heap and heap[0][0] <= now:
+            expires, hostname = heapq.heappop(heap)
+            entry = self.__map.get(hostname)
+            if entry is not None and entry[1] == expires:
+                del self.__map[hostname]
+                expired.append(hostname)
+        return expired
+
+    def __compact(self):
+        ''' rebuild heap without stale entries '''
+        self.__heap = [
+            (expires, hostname)
+            for hostname, (_, expires) in self.__map.items()
+            if expires is not None
+        ]
+        heapq.heapify(self.__heap)
+
+    async def __addrmap(self, e):
+        if e.destination == '<error>' or 'error' in e.kwargs:
+            self.remove(e.hostname)
+            return
+        self.set(e.hostname, e.destination, parse_expiry(e))
+
+
+def parse_expiry(e):
+    ''' return unix timestamp of AddrMapEvent expiry (None for never) '''
+    if e.kwargs.get('EXPIRES', 'NEVER') != 'NEVER':
+        t = datetime.strptime(e.kwargs['EXPIRES'], '%Y-%m-%d %H:%M:%S')
+        return t.replace(tzinfo=timezone.utc).timestamp()
+    if e.expiry == 'NEVER':
+        return None
+    return time.mktime(time.strptime(e.expiry, '%Y-%m-%d %H:%M:%S'))
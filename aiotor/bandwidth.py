@@ -0,0 +1,222 @@
+import asyncio
+import numpy as np
+import time
+
+# event types consumed by BandwidthStats
+EVENTS = ['CIRC_BW', 'CONN_BW', 'CELL_STATS', 'CIRC', 'ORCONN']
+
+class BandwidthStats:
+
+    def __init__(self, controller, alpha=0.2, capacity=1024):
+        self.controller = controller
+        # a second without CIRC_BW/CONN_BW counts as a zero sample so
+        # stalled circuits sink to the bottom instead of keeping old rates
+        self.circuits = RollingStats(
+            ['read', 'written', 'queue_time'],
+            alpha,
+            capacity,
+            decay=['read', 'written'],
+        )
+        self.connections = RollingStats(
+            ['read', 'written'],
+            alpha,
+            capacity,
+            decay=['read', 'written'],
+        )
+        # number of events skipped because they couldn't be parsed
+        self.malformed = 0
+        self.task = None
+
+    def start(self, max_batch=500, max_delay=0.05):
+        ''' start consuming bandwidth events in batches '''
+        self.task = asyncio.create_task(self.__run(max_batch, max_delay))
+
+    async def stop(self):
+        ''' stop consuming events (unsubscribes via SETEVENTS) '''
+        if self.task is None:
+            return
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+
+    async def __run(self, max_batch, max_delay):
+        events = self.controller.events
+        async with events.stream(EVENTS, max_batch, max_delay) as stream:
+            async for batch in stream:
+                self.update(batch)
+
+    def update(self, events):
+        ''' update statistics from a list of events '''
+        now = time.monotonic()
+        for e in events:
+            try:
+                self.__update(e, now)
+            except (TypeError, ValueError):
+                self.malformed += 1
+
+    def __update(self, e, now):
+        circuits = self.circuits
+        connections = self.connections
+        if e.type == 'CIRC_BW':
+            # emitted once per second so values are bytes per second
+            read, written = int(e.read), int(e.written)
+            circuits.update(e.id, 'read', read, now)
+            circuits.update(e.id, 'written', written, now)
+        elif e.type == 'CONN_BW':
+            # only OR connections are closed by ORCONN events, DIR/EXIT
+            # rows would never be freed
+            if e.conn_type != 'OR':
+                return
+            read, written = int(e.read), int(e.written)
+            connections.update(e.id, 'read', read, now)
+            connections.update(e.id, 'written', written, now)
+        elif e.type == 'CELL_STATS':
+            if e.id is None:
+                return
+            cells = sum(e.inbound_removed.values())
+            cells += sum(e.outbound_removed.values())
+            if cells:
+                msec = sum(e.inbound_time.values())
+                msec += sum(e.outbound_time.values())
+                circuits.update(e.id, 'queue_time', msec / cells, now)
+        elif e.type == 'CIRC':
+            if e.status in ('CLOSED', 'FAILED'):
+                circuits.remove(e.id)
+        elif e.type == 'ORCONN':
+            if e.status in ('CLOSED', 'FAILED') and 'ID' in e.kwargs:
+                connections.remove(e.kwargs['ID'])
+
+    def worst_circuits(self, n=10, by='throughput'):
+        '''
+        return up to n (circuit id, value) pairs with the lowest throughput
+        (bytes/s) or, with by='queue_time', highest msec queued per cell
+        '''
+        return self.__worst(self.circuits, n, by)
+
+    def worst_connections(self, n=10):
+        ''' return up to n (OR connection id, bytes/s) lowest throughput '''
+        return self.__worst(self.connections, n, 'throughput')
+
+    def __worst(self, stats, n, by):
+        now = time.monotonic()
+        if by == 'throughput':
+            values = stats.column('read', now) + stats.column('written', now)
+            return stats.worst(n, values)
+        return stats.worst(n, stats.column(by, now), largest=True)
+
+
+class RollingStats:
+
+    def __init__(self, columns, alpha=0.2, capacity=1024, decay=(),
+            interval=1.0):
+        self.columns = {name: i for i, name in enumerate(columns)}
+        self.alpha = alpha
+        # columns where every interval without a sample counts as a zero
+        self.decay = {self.columns[name] for name in decay}
+        self.interval = interval
+        # id -> row, row -> id (None for free rows)
+        self.rows = {}
+        self.ids = [None] * capacity
+        self.__free = list(range(capacity - 1, -1, -1))
+        # exponentially weighted moving averages (NaN until first sample)
+        self.values = np.full((capacity, len(columns)), np.nan)
+        # time of the last sample of each column
+        self.updated = np.zeros((capacity, len(columns)))
+        self.active = np.zeros(capacity, dtype=bool)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def update(self, id, column, value, now=None):
+        ''' add sample to the moving average of column for id '''
+        if now is None:
+            now = time.monotonic()
+        row = self.rows.get(id)
+        if row is None:
+            row = self.__add(id)
+        col = self.columns[column]
+        old = self.values[row, col]
+        if old != old:
+            # NaN, first sample
+            self.values[row, col] = value
+        else:
+            if col in self.decay:
+                old *= self.__decay(now - self.updated[row, col])
+            self.values[row, col] = old + self.alpha * (value - old)
+        self.updated[row, col] = now
+
+    def remove(self, id):
+        ''' forget id and free its row '''
+        row = self.rows.pop(id, None)
+        if row is None:
+            return
+        self.ids[row] = None
+        self.active[row] = False
+        self.values[row] = np.nan
+        self.__free.append(row)
+
+    def get(self, id, column, now=None):
+        ''' return moving average of column for id (None if unknown) '''
+        row = self.rows.get(id)
+        if row is None:
+            return None
+        value = self.column(column, now)[row]
+        return None if value != value else float(value)
+
+    def column(self, column, now=None):
+        ''' array of column values for every row (decayed up to now) '''
+        col = self.columns[column]
+        values = self.values[:, col]
+        if col not in self.decay:
+            return values
+        if now is None:
+            now = time.monotonic()
+        return values * self.__decay(now - self.updated[:, col])
+
+    def __decay(self, elapsed):
+        ''' factor for the zero samples missed during elapsed seconds '''
+        # whole intervals without a sample, so a late event isn't penalized
+        missed = np.maximum(np.floor(elapsed / self.interval) - 1, 0)
+        return (1 - self.alpha) ** missed
+
+    def worst(self, n, values, largest=False):
+        '''
+        return up to n (id, value) pairs of active rows with the smallest
+        (or largest) values
+        '''
+        mask = self.active & ~np.isnan(values)
+        rows = np.flatnonzero(mask)
+        keys = -values[rows] if largest else values[rows]
+        if n < len(rows):
+            part = np.argpartition(keys, n)[:n]
+            rows, keys = rows[part], keys[part]
+        order = np.argsort(keys, kind='stable')
+        return [(self.ids[r], float(values[r])) for r in rows[order]]
+
+    def __add(self, id):
+        ''' assign a row to id, doubling capacity when full '''
+        if not self.__free:
+            self.__grow()
+        row = self.__free.pop()
+        self.rows[id] = row
+        self.ids[row] = id
+        self.active[row] = True
+        return row
+
+    def __grow(self):
+        capacity = len(self.ids)
+        ncols = self.values.shape[1]
+        self.values = np.concatenate(
+            [self.values, np.full((capacity, ncols), np.nan)],
+        )
+        self.updated = np.concatenate(
+            [self.updated, np.zeros((capacity, ncols))],
+        )
+        self.active = np.concatenate(
+            [self.active, np.zeros(capacity, dtype=bool)],
+        )
+        self.ids.extend([None] * capacity)
+        self.__free.extend(range(2 * capacity - 1, capacity - 1, -1))
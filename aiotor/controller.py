@@ -2,7 +2,11 @@ import asyncio
 import hashlib
 import hmac
 from os import urandom
+import re
+from .addrmap import AddressMap
+from .descriptors import Descriptors
 from .events import Events
+from .identity import Identity
 from .onions import Onions
 from .textprotocol import parse, parse_keywords, TextProtocol
 
@@ -13,6 +17,9 @@ class Controller:
         self.port = port
         self.events = Events(self)
         self.onions = Onions(self)
+        self.identity = Identity(self)
+        self.addrmap = AddressMap(self)
+        self.descriptors = Descriptors(self)
         self.io = None
         self.auth = {
             'methods': [],
@@ -50,6 +57,8 @@ class Controller:
             raise Exception('no authentication method available')
         if resp['status'] != 250:
             raise Exception('authentication failed')
+        # listeners added before connecting haven't been sent yet
+        await self.events.resubscribe()
 
     async def __authenticate_none(self):
         return await self.io.cmd('AUTHENTICATE')
@@ -97,8 +106,71 @@ class Controller:
             raise Exception('Request failed')
 
     async def map_address(self, src, dst):
-        x = 'MAPADDRESS {}={}'.format(src, dst)
+        ''' map src to dst, returns dict of the confirmed mapping '''
+        return await self.map_addresses({src: dst})
+
+    async def map_addresses(self, mapping, chunk_size=256):
+        '''
+        map many src -> dst pairs with multi-pair MAPADDRESS commands and
+        return the confirmed mapping, if tor rejects any pair every other
+        chunk is still sent and MapAddressError is raised at the end
+        '''
+        items = list(mapping.items())
+        result = {}
+        failed = []
+        for i in range(0, len(items), chunk_size):
+            chunk = items[i:i + chunk_size]
+            pairs = ' '.join('{}={}'.format(src, dst) for src, dst in chunk)
+            resp = await self.io.cmd('MAPADDRESS ' + pairs)
+            # one status line per pair, 250 and 5xx lines can be mixed
+            for status, line in zip(resp['statuses'], resp['lines']):
+                if status == 250 and '=' in line:
+                    src, dst = line.split('=', maxsplit=1)
+                    result[src] = dst
+                else:
+                    failed.append(failed_source(line))
+            if not resp['lines'] and resp['status'] != 250:
+                failed.extend(src for src, dst in chunk)
+        self.addrmap.update(result)
+        if failed:
+            raise MapAddressError(result, failed)
+        return result
+
+    async def extend_circuit(self, path, circuit_id='0'):
+        ''' build a circuit (or extend an existing one) along path '''
+        x = 'EXTENDCIRCUIT {} {}'.format(circuit_id, ','.join(path))
         resp = await self.io.cmd(x)
         if resp['status'] != 250:
             raise Exception('Request failed')
-        return resp
\ No newline at end of file
+        args, kwargs = parse(resp['lines'][0])
+        return args[1]
+
+    async def hs_fetch(self, address, timeout=60):
+        ''' fetch onion service descriptor (cached for its lifetime) '''
+        return await self.descriptors.fetch(address, timeout=timeout)
+
+    async def hs_fetch_many(self, addresses, concurrency=16, timeout=60):
+        ''' fetch many onion service descriptors concurrently '''
+        return await self.descriptors.fetch_many(
+            addresses,
+            concurrency=concurrency,
+            timeout=timeout,
+        )
+
+
+class MapAddressError(Exception):
+
+    def __init__(self, mapped, failed):
+        super().__init__('Request failed: ' + ', '.join(failed))
+        # mappings tor did apply and sources (or error lines) it rejected
+        self.mapped = mapped
+        self.failed = failed
+
+
+def failed_source(line):
+    ''' extract source address from a MAPADDRESS error line '''
+    # e.g. "syntax error: invalid address 'x'" or "skipping 'x=y'"
+    m = re.search("'([^']*)'", line)
+    if m is None:
+        return line
+    return m.group(1).split('=', maxsplit=1)[0]
@@ -0,0 +1,149 @@
+import asyncio
+from collections import OrderedDict
+import time
+
+class Descriptors:
+
+    def __init__(self, controller, cache_size=10000):
+        self.controller = controller
+        self.cache = DescriptorCache(cache_size)
+        # address -> task shared by concurrent fetches of that address
+        self.__inflight = {}
+
+    async def fetch(self, address, timeout=60, cache=True):
+        '''
+        fetch onion service descriptor with HSFETCH, returns Descriptor or
+        None if tor rejected the request or the fetch failed or timed out
+        '''
+        address = strip_onion(address)
+        if cache:
+            descriptor = self.cache.get(address)
+            if descriptor is not None:
+                return descriptor
+        if address not in self.__inflight:
+            task = asyncio.create_task(self.__fetch(address, timeout))
+            task.add_done_callback(lambda t: self.__inflight.pop(address))
+            self.__inflight[address] = task
+        return await asyncio.shield(self.__inflight[address])
+
+    async def fetch_many(self, addresses, concurrency=16, timeout=60):
+        ''' fetch many descriptors, returns dict of address -> Descriptor '''
+        semaphore = asyncio.Semaphore(concurrency)
+        async def fetch(address):
+            async with semaphore:
+                return await self.fetch(address, timeout=timeout)
+        addresses = [strip_onion(address) for address in addresses]
+        # keep both event types subscribed for the whole batch so SETEVENTS
+        # isn't resent whenever no fetch happens to be in flight
+        events = self.controller.events
+        await events.add('HS_DESC', self.__ignore)
+        await events.add('HS_DESC_CONTENT', self.__ignore)
+        try:
+            results = await asyncio.gather(*(fetch(a) for a in addresses))
+        finally:
+            await events.remove('HS_DESC', self.__ignore)
+            await events.remove('HS_DESC_CONTENT', self.__ignore)
+        return dict(zip(addresses, results))
+
+    async def __ignore(self, event):
+        pass
+
+    async def __fetch(self, address, timeout):
+        ''' issue HSFETCH and wait for the matching HS_DESC events '''
+        controller = self.controller
+        events = controller.events
+        result = asyncio.get_running_loop().create_future()
+        async def hs_desc(e):
+            if not result.done():
+                result.set_result(None)
+        async def desc_content(e):
+            if not result.done():
+                result.set_result(e.descriptor or None)
+        failed = lambda e: e.action == 'FAILED'
+        await events.add('HS_DESC', hs_desc, key=address, where=failed)
+        await events.add('HS_DESC_CONTENT', desc_content, key=address)
+        try:
+            resp = await controller.io.cmd('HSFETCH ' + address)
+            if resp['status'] == 250:
+                text = await asyncio.wait_for(result, timeout)
+            else:
+                # rejected (e.g. 512 invalid address), same as not found
+                text = None
+        except asyncio.TimeoutError:
+            text = None
+        finally:
+            await events.remove('HS_DESC', hs_desc, key=address)
+            await events.remove('HS_DESC_CONTENT', desc_content, key=address)
+        if text is None:
+            return None
+        descriptor = Descriptor(address, text)
+        self.cache.put(descriptor)
+        return descriptor
+
+
+class Descriptor:
+
+    def __init__(self, address, text):
+        self.address = address
+        self.text = text
+        self.version = None
+        self.lifetime = None
+        self.revision_counter = None
+        self.fetched = time.time()
+        self.__parse()
+
+    def __parse(self):
+        ''' parse outer (unencrypted) descriptor fields '''
+        for line in self.text.splitlines():
+            keyword, _, value = line.partition(' ')
+            if keyword == 'hs-descriptor':
+                self.version = int(value)
+            elif keyword == 'descriptor-lifetime':
+                # lifetime is given in minutes
+                self.lifetime = int(value) * 60
+            elif keyword == 'revision-counter':
+                self.revision_counter = int(value)
+
+
+class DescriptorCache:
+
+    def __init__(self, max_size=10000, default_ttl=3 * 60 * 60):
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        # address -> (expires, Descriptor) in least recently used order
+        self.__entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def get(self, address):
+        ''' return cached Descriptor for address unless it has expired '''
+        entry = self.__entries.get(address)
+        if entry is None:
+            return None
+        expires, descriptor = entry
+        if expires <= time.time():
+            del self.__entries[address]
+            return None
+        self.__entries.move_to_end(address)
+        return descriptor
+
+    def put(self, descriptor):
+        ''' cache Descriptor for its lifetime, evicting least recently used '''
+        ttl = descriptor.lifetime or self.default_ttl
+        expires = descriptor.fetched + ttl
+        self.__entries[descriptor.address] = (expires, descriptor)
+        self.__entries.move_to_end(descriptor.address)
+        while len(self.__entries) > self.max_size:
+            self.__entries.popitem(last=False)
+
+    def remove(self, address):
+        ''' drop cached Descriptor for address '''
+        self.__entries.pop(address, None)
+
+
+def strip_onion(address):
+    ''' return onion address without .onion suffix '''
+    if address.endswith('.onion'):
+        return address[:-len('.onion')]
+    return address
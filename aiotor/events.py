@@ -1,11 +1,17 @@
 import asyncio
+from collections import deque
 
 class Events:
 
     def __init__(self, controller):
         self.controller = controller
         self.queue = asyncio.Queue()
+        # event type -> set of (listener, where) receiving every event
         self.__listeners = {}
+        # event type -> {key: set of (listener, where)} by Event.key_field
+        self.__keyed = {}
+        # event type -> set of EventStreams
+        self.__streams = {}
         self.__events = set()
 
     def start_loop(self):
@@ -21,7 +27,12 @@ class Events:
 
     async def __update_events(self):
         ''' send SETEVENTS command when set of event listeners changes '''
-        events = set(self.__listeners.keys())
+        if self.controller.io is None:
+            # not connected (offline replay), sent by resubscribe() once
+            # the controller has authenticated
+            return
+        events = set(self.__listeners.keys()) | set(self.__keyed.keys())
+        events |= set(self.__streams.keys())
         if events != self.__events:
             self.__events = events
             eventstr = ' '.join(events)
@@ -29,30 +40,201 @@ class Events:
             if resp['status'] != 250:
                 raise Exception('unable to send SETEVENTS')
 
-    async def add(self, event, listener):
-        ''' add listener for event type '''
-        if event not in self.__listeners:
-            self.__listeners[event] = set()
-        self.__listeners[event].add(listener)
+    async def resubscribe(self):
+        ''' send SETEVENTS for every current listener on a new connection '''
+        # a new connection starts with no events enabled
+        self.__events = set()
+        await self.__update_events()
+
+    async def add(self, event, listener, key=None, where=None):
+        '''
+        add listener for event type, if key is given only events whose
+        key_field (HS_DESC address, CIRC id, STREAM id, ...) equals key are
+        delivered, if where is given only events where it returns True
+        '''
+        if key is None:
+            listeners = self.__listeners.setdefault(event, set())
+        else:
+            event_type = EVENT_TYPES.get(event)
+            if event_type is None or event_type.key_field is None:
+                raise Exception('event type has no key field')
+            keyed = self.__keyed.setdefault(event, {})
+            listeners = keyed.setdefault(key, set())
+        listeners.add((listener, where))
         await self.__update_events()
 
-    async def remove(self, event, listener):
-        ''' remove listener for event type '''
-        if event in self.__listeners:
-            self.__listeners[event].discard(listener)
-            if len(self.__listeners[event]) == 0:
-                del self.__listeners[event]
+    async def remove(self, event, listener, key=None, where=None):
+        '''
+        remove listener for event type (and key), if where is given only
+        the subscription with that predicate is removed
+        '''
+        if key is None:
+            if event in self.__listeners:
+                discard(self.__listeners[event], listener, where)
+                if len(self.__listeners[event]) == 0:
+                    del self.__listeners[event]
+        elif event in self.__keyed:
+            keyed = self.__keyed[event]
+            if key in keyed:
+                discard(keyed[key], listener, where)
+                if len(keyed[key]) == 0:
+                    del keyed[key]
+            if len(keyed) == 0:
+                del self.__keyed[event]
+        await self.__update_events()
+
+    def stream(self, events, max_batch=500, max_delay=0.05, max_size=None):
+        '''
+        return EventStream yielding lists of events for one or more event
+        types, SETEVENTS is updated when iteration (or "async with") starts
+        and again when it ends
+        '''
+        if isinstance(events, str):
+            events = [events]
+        return EventStream(self, events, max_batch, max_delay, max_size)
+
+    async def add_stream(self, stream):
+        ''' start delivering events to an EventStream '''
+        for event in stream.types:
+            self.__streams.setdefault(event, set()).add(stream)
+        await self.__update_events()
+
+    async def remove_stream(self, stream):
+        ''' stop delivering events to an EventStream '''
+        for event in stream.types:
+            if event in self.__streams:
+                self.__streams[event].discard(stream)
+                if len(self.__streams[event]) == 0:
+                    del self.__streams[event]
         await self.__update_events()
 
     async def __dispatch(self, event):
         ''' dispatch event '''
+        if event.type in self.__streams:
+            # streams only buffer the event, no await per stream
+            for stream in self.__streams[event.type]:
+                stream.put(event)
+        listeners = ()
         if event.type in self.__listeners:
-            for listener in self.__listeners[event.type]:
-                await listener(event)
+            listeners = tuple(self.__listeners[event.type])
+        keyed = self.__keyed.get(event.type)
+        if keyed:
+            key = getattr(event, event.key_field)
+            if key in keyed:
+                listeners += tuple(keyed[key])
+        for listener, where in listeners:
+            if where is not None and not where(event):
+                continue
+            await listener(event)
+
+
+def discard(subscriptions, listener, where=None):
+    ''' remove (listener, where) entries, all of listener's if where=None '''
+    for subscription in list(subscriptions):
+        if subscription[0] != listener:
+            continue
+        if where is None or subscription[1] is where:
+            subscriptions.discard(subscription)
+
+
+class EventStream:
+
+    def __init__(self, events, types, max_batch=500, max_delay=0.05,
+            max_size=None):
+        self.events = events
+        self.types = list(types)
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        # oldest events are dropped (and counted) beyond max_size
+        if max_size is None:
+            max_size = 100 * max_batch
+        self.max_size = max_size
+        self.dropped = 0
+        self.__buffer = deque()
+        self.__ready = asyncio.Event()
+        self.__full = asyncio.Event()
+        self.__started = False
+        self.__closed = False
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    def __aiter__(self):
+        return self.__batches()
+
+    async def __batches(self):
+        '''
+        yield batches, if iteration subscribed the stream (no "async with")
+        it unsubscribes when the loop ends, breaks or is cancelled
+        '''
+        owner = not self.__started
+        await self.start()
+        try:
+            while True:
+                batch = await self.get()
+                if batch is None:
+                    return
+                yield batch
+        finally:
+            if owner:
+                await self.stop()
+
+    async def get(self):
+        ''' wait for the next batch of events (None once stopped) '''
+        buffer = self.__buffer
+        if not buffer and not self.__closed:
+            await self.__ready.wait()
+        if not buffer:
+            return None
+        # give a partial batch up to max_delay to fill up
+        if len(buffer) < self.max_batch and self.max_delay:
+            try:
+                await asyncio.wait_for(self.__full.wait(), self.max_delay)
+            except asyncio.TimeoutError:
+                pass
+        n = min(self.max_batch, len(buffer))
+        batch = [buffer.popleft() for _ in range(n)]
+        if len(buffer) < self.max_batch:
+            self.__full.clear()
+            if not buffer and not self.__closed:
+                self.__ready.clear()
+        return batch
+
+    async def start(self):
+        ''' subscribe to event types (sends SETEVENTS if needed) '''
+        if not self.__started:
+            self.__started = True
+            await self.events.add_stream(self)
+
+    async def stop(self):
+        ''' unsubscribe from event types and end iteration '''
+        if not self.__closed:
+            self.__closed = True
+            self.__ready.set()
+            await self.events.remove_stream(self)
+
+    def put(self, event):
+        ''' buffer event (called by Events dispatch) '''
+        if self.__closed:
+            return
+        buffer = self.__buffer
+        if len(buffer) >= self.max_size:
+            buffer.popleft()
+            self.dropped += 1
+        buffer.append(event)
+        self.__ready.set()
+        if len(buffer) >= self.max_batch:
+            self.__full.set()
 
 
 class Event:
-    pass
+
+    # attribute used to index keyed listeners (None if not keyable)
+    key_field = None
 
 
 class BandwidthEvent(Event):
@@ -68,6 +250,7 @@ class BandwidthEvent(Event):
 class CircuitEvent(Event):
 
     type = 'CIRC'
+    key_field = 'id'
 
     def __init__(self, id, status, path=None, **kwargs):
         self.id = id
@@ -79,6 +262,7 @@ class CircuitEvent(Event):
 class StreamEvent(Event):
 
     type = 'STREAM'
+    key_field = 'id'
 
     def __init__(self, id, status, circ_id, target, **kwargs):
         self.id = id
@@ -91,6 +275,7 @@ class StreamEvent(Event):
 class AddrMapEvent(Event):
 
     type = 'ADDRMAP'
+    key_field = 'hostname'
 
     def __init__(self, hostname, destination, expiry, **kwargs):
         self.hostname = hostname
@@ -102,6 +287,7 @@ class AddrMapEvent(Event):
 class HiddenServiceEvent(Event):
 
     type = 'HS_DESC'
+    key_field = 'address'
 
     def __init__(self, *args, **kwargs):
         self.action = args[0]
@@ -118,6 +304,7 @@ class HiddenServiceEvent(Event):
 class StreamBandwidthEvent(Event):
 
     type = 'STREAM_BW'
+    key_field = 'id'
 
     def __init__(self, id, written, read, time, **kwargs):
         self.id = id
@@ -169,6 +356,7 @@ class OrConnEvent(Event):
 class CircMinorEvent(Event):
 
     type = 'CIRC_MINOR'
+    key_field = 'id'
 
     def __init__(self, id, event, path=None, **kwargs):
         self.id = id
@@ -210,11 +398,14 @@ class StatusServerEvent(Event):
 class HSDescContentEvent(Event):
 
     type = 'HS_DESC_CONTENT'
+    key_field = 'address'
 
-    def __init__(self, address, descriptor_id, directory, **kwargs):
+    def __init__(self, address, descriptor_id, directory, descriptor='',
+            **kwargs):
         self.address = address
         self.descriptor_id = descriptor_id
         self.directory = directory
+        self.descriptor = descriptor
         self.kwargs = kwargs
 
 
@@ -230,6 +421,62 @@ class TransportLaunchedEvent(Event):
         self.kwargs = kwargs
 
 
+class CircuitBandwidthEvent(Event):
+
+    type = 'CIRC_BW'
+    key_field = 'id'
+
+    def __init__(self, **kwargs):
+        self.id = kwargs.pop('ID', None)
+        self.read = kwargs.pop('READ', None)
+        self.written = kwargs.pop('WRITTEN', None)
+        self.time = kwargs.pop('TIME', None)
+        self.kwargs = kwargs
+
+
+class ConnectionBandwidthEvent(Event):
+
+    type = 'CONN_BW'
+    key_field = 'id'
+
+    def __init__(self, **kwargs):
+        self.id = kwargs.pop('ID', None)
+        self.conn_type = kwargs.pop('TYPE', None)
+        self.read = kwargs.pop('READ', None)
+        self.written = kwargs.pop('WRITTEN', None)
+        self.kwargs = kwargs
+
+
+class CellStatsEvent(Event):
+
+    type = 'CELL_STATS'
+    key_field = 'id'
+
+    def __init__(self, **kwargs):
+        self.id = kwargs.pop('ID', None)
+        self.inbound_queue = kwargs.pop('InboundQueue', None)
+        self.inbound_conn = kwargs.pop('InboundConn', None)
+        self.inbound_added = parse_cells(kwargs.pop('InboundAdded', ''))
+        self.inbound_removed = parse_cells(kwargs.pop('InboundRemoved', ''))
+        self.inbound_time = parse_cells(kwargs.pop('InboundTime', ''))
+        self.outbound_queue = kwargs.pop('OutboundQueue', None)
+        self.outbound_conn = kwargs.pop('OutboundConn', None)
+        self.outbound_added = parse_cells(kwargs.pop('OutboundAdded', ''))
+        self.outbound_removed = parse_cells(kwargs.pop('OutboundRemoved', ''))
+        self.outbound_time = parse_cells(kwargs.pop('OutboundTime', ''))
+        self.kwargs = kwargs
+
+
+def parse_cells(text):
+    ''' parse "relay:1,create:2" cell counts into dict of cell type -> int '''
+    cells = {}
+    for item in text.split(','):
+        if item:
+            name, _, count = item.partition(':')
+            cells[name] = int(count)
+    return cells
+
+
 # registered event types
 EVENT_TYPES = {
     'BW': BandwidthEvent,
@@ -248,4 +495,7 @@ EVENT_TYPES = {
     'STATUS_SERVER': StatusServerEvent,
     'HS_DESC_CONTENT': HSDescContentEvent,
     'TRANSPORT_LAUNCHED': TransportLaunchedEvent,
+    'CIRC_BW': CircuitBandwidthEvent,
+    'CONN_BW': ConnectionBandwidthEvent,
+    'CELL_STATS': CellStatsEvent,
 }
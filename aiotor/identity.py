@@ -0,0 +1,97 @@
+import asyncio
+
+class Identity:
+
+    # tor ignores NEWNYM more often than this (MAX_SIGNEWNYM_RATE), delaying
+    # the signal until the interval has passed
+    interval = 10
+    # seconds to wait for the SIGNAL event confirming a sent NEWNYM
+    timeout = 30
+
+    def __init__(self, controller):
+        self.controller = controller
+        # event loop time of the last NEWNYM confirmed by a SIGNAL event
+        self.last = None
+        # callers waiting for the next NEWNYM (not sent yet)
+        self.__waiter = None
+        # callers waiting for confirmation of the NEWNYM already sent
+        self.__sent = None
+        self.__task = None
+        self.__sleeping = False
+        self.__listening = False
+
+    async def rotate(self):
+        '''
+        request a new identity and wait until tor has applied it, concurrent
+        calls are coalesced into a single SIGNAL NEWNYM (raises
+        asyncio.TimeoutError if tor doesn't confirm it within timeout)
+        '''
+        if self.__waiter is None:
+            loop = asyncio.get_running_loop()
+            self.__waiter = loop.create_future()
+            self.__task = asyncio.create_task(self.__request())
+        await asyncio.shield(self.__waiter)
+
+    async def close(self):
+        ''' stop listening for SIGNAL events '''
+        if self.__listening:
+            self.__listening = False
+            await self.controller.events.remove('SIGNAL', self.__signal)
+
+    async def __request(self):
+        ''' wait out the rate limit then send NEWNYM '''
+        controller = self.controller
+        loop = asyncio.get_running_loop()
+        waiter = self.__waiter
+        try:
+            if not self.__listening:
+                self.__listening = True
+                newnym = lambda e: e.signal == 'NEWNYM'
+                events = controller.events
+                await events.add('SIGNAL', self.__signal, where=newnym)
+            if self.__sent is not None:
+                # let the NEWNYM already sent be confirmed first so the
+                # rate limit below starts from it
+                await asyncio.wait([self.__sent])
+            if self.last is not None:
+                delay = self.last + self.interval - loop.time()
+                if delay > 0:
+                    self.__sleeping = True
+                    try:
+                        await asyncio.sleep(delay)
+                    finally:
+                        self.__sleeping = False
+            # callers arriving from now on need another NEWNYM
+            self.__waiter = None
+            self.__sent = waiter
+            await controller.signal('NEWNYM')
+            await asyncio.wait_for(asyncio.shield(waiter), self.timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if not waiter.done():
+                waiter.set_exception(e)
+        finally:
+            if self.__waiter is waiter:
+                self.__waiter = None
+            if self.__sent is waiter:
+                self.__sent = None
+
+    async def __signal(self, e):
+        ''' NEWNYM took effect (ours or from another controller) '''
+        self.last = asyncio.get_running_loop().time()
+        if self.__sent is not None:
+            # confirms the NEWNYM we sent, later callers keep waiting
+            waiter = self.__sent
+            self.__sent = None
+        else:
+            waiter = self.__waiter
+            if waiter is None:
+                return
+            self.__waiter = None
+            # a NEWNYM from elsewhere satisfies pending callers, no need to
+            # send
+            if self.__sleeping:
+                self.__task.cancel()
+        if not waiter.done():
+            waiter.set_result(None)
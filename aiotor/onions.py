@@ -1,8 +1,10 @@
 import asyncio
 import base64
 from cryptography.hazmat.primitives.asymmetric import ed25519
+from cryptography.hazmat.primitives.asymmetric import x25519
 from cryptography.hazmat.primitives import serialization
 import hashlib
+from .descriptors import strip_onion
 from .textprotocol import parse
 
 class Onions:
@@ -20,6 +22,9 @@ class Onions:
         ports = onion.ports
         ports_str = ' '.join('Port={},{}'.format(k, ports[k]) for k in ports)
         cmd_str = 'ADD_ONION ' + key_str + ' ' + ports_str
+        if onion.client_auth:
+            clients = ' '.join('ClientAuthV3=' + k for k in onion.client_auth)
+            cmd_str += ' Flags=V3Auth ' + clients
         resp = await controller.io.cmd(cmd_str)
         if resp['status'] != 250:
             raise Exception('Request failed')
@@ -33,13 +38,12 @@ class Onions:
         if wait:
             event = asyncio.Event()
             async def hs_desc(e):
-                if e.address != onion.id:
-                    return
-                if e.action == 'UPLOADED':
-                    event.set()
-            await controller.events.add('HS_DESC', hs_desc)
+                event.set()
+            uploaded = lambda e: e.action == 'UPLOADED'
+            events = controller.events
+            await events.add('HS_DESC', hs_desc, key=onion.id, where=uploaded)
             await event.wait()
-            await controller.events.remove('HS_DESC', hs_desc)
+            await events.remove('HS_DESC', hs_desc, key=onion.id)
         return onion
 
     async def remove(self, onion):
@@ -51,6 +55,72 @@ class Onions:
         if onion.id in self.__onions:
             del self.__onions[onion.id]
 
+    async def add_client_auth(self, address, key, name=None, permanent=False):
+        ''' add client credentials (ClientAuthKey) for a remote onion '''
+        cmd_str = 'ONION_CLIENT_AUTH_ADD {} x25519:{}'.format(
+            strip_onion(address),
+            key.private_str(),
+        )
+        if name is not None:
+            cmd_str += ' ClientName=' + name
+        if permanent:
+            cmd_str += ' Flags=Permanent'
+        resp = await self.controller.io.cmd(cmd_str)
+        # 251 means existing credentials were replaced
+        if resp['status'] not in (250, 251):
+            raise Exception('Request failed')
+
+    async def add_client_auths(self, credentials, batch_size=256, **kwargs):
+        ''' add client credentials for many onions (dict address -> key) '''
+        items = list(credentials.items())
+        for i in range(0, len(items), batch_size):
+            batch = items[i:i + batch_size]
+            await asyncio.gather(*(
+                self.add_client_auth(address, key, **kwargs)
+                for address, key in batch
+            ))
+
+    async def remove_client_auth(self, address):
+        ''' remove client credentials for a remote onion '''
+        cmd_str = 'ONION_CLIENT_AUTH_REMOVE ' + strip_onion(address)
+        resp = await self.controller.io.cmd(cmd_str)
+        # 251 means there were no credentials to remove
+        if resp['status'] not in (250, 251):
+            raise Exception('Request failed')
+
+    async def remove_client_auths(self, addresses, batch_size=256):
+        ''' remove client credentials for many remote onions '''
+        addresses = list(addresses)
+        for i in range(0, len(addresses), batch_size):
+            batch = addresses[i:i + batch_size]
+            await asyncio.gather(*(self.remove_client_auth(a) for a in batch))
+
+    async def view_client_auth(self, address=None):
+        '''
+        return dict of address -> {'key', 'name', 'flags'} for stored client
+        credentials (all of them or only those for address)
+        '''
+        cmd_str = 'ONION_CLIENT_AUTH_VIEW'
+        if address is not None:
+            cmd_str += ' ' + strip_onion(address)
+        resp = await self.controller.io.cmd(cmd_str)
+        if resp['status'] != 250:
+            raise Exception('Request failed')
+        clients = {}
+        for line in resp['lines']:
+            # key blob is base64 (may end in "=") so split it off by hand
+            parts = line.split(' ', maxsplit=3)
+            if parts[0] != 'CLIENT':
+                continue
+            key_type, key = parts[2].split(':', maxsplit=1)
+            args, kwargs = parse(parts[3] if len(parts) > 3 else '')
+            clients[parts[1]] = {
+                'key': ClientAuthKey.from_private_str(key),
+                'name': kwargs.get('ClientName', None),
+                'flags': kwargs.get('Flags', ''),
+            }
+        return clients
+
 
 class Onion:
 
@@ -59,6 +129,8 @@ class Onion:
         self.key = 'BEST'
         self.id = None
         self.ports = {}
+        # base32 x25519 public keys of authorized clients
+        self.client_auth = []
 
     @classmethod
     def random(cls):
@@ -75,6 +147,72 @@ class Onion:
         onion.id = calculate_id(private_key.public_key())
         return onion
 
+    def add_client(self, key):
+        ''' authorize client by ClientAuthKey or base32 public key '''
+        if isinstance(key, ClientAuthKey):
+            key = key.public_str()
+        self.client_auth.append(key)
+
+
+class ClientAuthKey:
+
+    def __init__(self, private_key):
+        self.private_key = private_key
+
+    @classmethod
+    def random(cls):
+        ''' generate new random x25519 client key '''
+        return cls(x25519.X25519PrivateKey.generate())
+
+    @classmethod
+    def from_private_str(cls, s):
+        ''' create ClientAuthKey from base64 private key (Tor format) '''
+        b = base64.b64decode(s)
+        return cls(x25519.X25519PrivateKey.from_private_bytes(b))
+
+    def private_str(self):
+        ''' base64 private key as used by ONION_CLIENT_AUTH_ADD '''
+        b = self.private_key.private_bytes(
+            encoding=serialization.Encoding.Raw,
+            format=serialization.PrivateFormat.Raw,
+            encryption_algorithm=serialization.NoEncryption(),
+        )
+        return base64.b64encode(b).decode('utf8')
+
+    def public_str(self):
+        ''' base32 public key as used by ClientAuthV3 '''
+        b = self.private_key.public_key().public_bytes(
+            encoding=serialization.Encoding.Raw,
+            format=serialization.PublicFormat.Raw,
+        )
+        return base64.b32encode(b).decode('utf8').replace('=', '')
+
+
+async def generate_client_keys(count, executor=None, chunk_size=256):
+    '''
+    generate count ClientAuthKeys in an executor (default thread pool or
+    e.g. a ProcessPoolExecutor) without blocking the event loop
+    '''
+    loop = asyncio.get_running_loop()
+    sizes = [min(chunk_size, count - i) for i in range(0, count, chunk_size)]
+    chunks = await asyncio.gather(*(
+        loop.run_in_executor(executor, generate_raw_keys, n) for n in sizes
+    ))
+    from_bytes = x25519.X25519PrivateKey.from_private_bytes
+    return [ClientAuthKey(from_bytes(b)) for chunk in chunks for b in chunk]
+
+def generate_raw_keys(count):
+    ''' generate count raw x25519 private keys (picklable for workers) '''
+    keys = []
+    for _ in range(count):
+        private_key = x25519.X25519PrivateKey.generate()
+        keys.append(private_key.private_bytes(
+            encoding=serialization.Encoding.Raw,
+            format=serialization.PrivateFormat.Raw,
+            encryption_algorithm=serialization.NoEncryption(),
+        ))
+    return keys
+
 
 def format_key(private_key):
     ''' convert ed25519 key to Tor format '''
@@ -0,0 +1,202 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import glob
+import gzip
+from itertools import islice
+import re
+import struct
+import time
+import zlib
+from .textprotocol import parse_event
+
+# record header: timestamp (float64), payload length (uint32)
+HEADER = struct.Struct('!dI')
+
+class Recorder:
+
+    def __init__(self, path, max_bytes=64 * 1024 * 1024, batch_size=1024,
+            flush_interval=1.0, compresslevel=6):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.compresslevel = compresslevel
+        self.controller = None
+        self.task = None
+        self.__buffer = []
+        self.__wakeup = asyncio.Event()
+        self.__executor = None
+        self.__file = None
+        self.__index = 0
+        self.__size = 0
+
+    async def start(self, controller, events=()):
+        ''' start recording raw events from controller '''
+        self.controller = controller
+        self.__executor = ThreadPoolExecutor(max_workers=1)
+        # continue numbering after logs left by earlier runs
+        indexes = [index for index, name in log_files(self.path)]
+        self.__index = max(indexes, default=0)
+        controller.io.recorder = self
+        for event in events:
+            await controller.events.add(event, self.__ignore)
+        self.task = asyncio.create_task(self.__loop())
+
+    async def stop(self, events=()):
+        ''' stop recording, flush remaining records and close log '''
+        controller = self.controller
+        if controller.io.recorder is self:
+            controller.io.recorder = None
+        for event in events:
+            await controller.events.remove(event, self.__ignore)
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        await self.flush()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.__executor, self.__close)
+        self.__executor.shutdown()
+        self.__executor = None
+
+    async def __ignore(self, event):
+        ''' placeholder listener so SETEVENTS includes recorded events '''
+        pass
+
+    def record(self, text):
+        ''' buffer raw event text (called by TextProtocol for each 650) '''
+        self.__buffer.append((time.time(), text))
+        if len(self.__buffer) >= self.batch_size:
+            self.__wakeup.set()
+
+    async def __loop(self):
+        ''' flush buffer when full or every flush_interval seconds '''
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self.__wakeup.wait(),
+                    self.flush_interval,
+                )
+            except asyncio.TimeoutError:
+                pass
+            self.__wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        ''' hand buffered records to the writer thread '''
+        if not self.__buffer:
+            return
+        batch = self.__buffer
+        self.__buffer = []
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.__executor, self.__write, batch)
+
+    def __write(self, batch):
+        ''' encode and write a batch of records (runs in writer thread) '''
+        chunks = []
+        for ts, text in batch:
+            data = text.encode('utf8')
+            chunks.append(HEADER.pack(ts, len(data)))
+            chunks.append(data)
+        data = b''.join(chunks)
+        if self.__file is None or self.__size >= self.max_bytes:
+            self.__rotate()
+        self.__file.write(data)
+        # sync flush so the log is readable up to here if the process dies
+        self.__file.flush()
+        self.__size += len(data)
+
+    def __rotate(self):
+        ''' close current log file and open the next one '''
+        self.__close()
+        self.__index += 1
+        name = log_name(self.path, self.__index)
+        self.__file = gzip.open(name, 'wb', compresslevel=self.compresslevel)
+        self.__size = 0
+
+    def __close(self):
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+
+class Replayer:
+
+    def __init__(self, paths):
+        self.paths = list(paths)
+
+    @classmethod
+    def from_prefix(cls, path):
+        ''' create Replayer for all rotated logs written by a Recorder '''
+        return cls(name for index, name in log_files(path))
+
+    async def replay(self, events, speed=1.0):
+        '''
+        feed recorded events into an Events queue, speed is a multiplier
+        of the original timing (None replays as fast as possible)
+        '''
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        first = None
+        count = 0
+        for path in self.paths:
+            records = read_log(path)
+            while True:
+                # decode records off the event loop, a batch at a time
+                batch = await loop.run_in_executor(
+                    None,
+                    read_batch,
+                    records,
+                    1024,
+                )
+                if not batch:
+                    break
+                for ts, text in batch:
+                    if first is None:
+                        first = ts
+                    if speed:
+                        delay = start + (ts - first) / speed - loop.time()
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+                    event = parse_event(text)
+                    if event is not None:
+                        await events.queue.put(event)
+                        count += 1
+        return count
+
+
+def log_name(path, index):
+    ''' return file name of rotated log number index '''
+    return '{}.{:06d}.gz'.format(path, index)
+
+def log_files(path):
+    ''' return sorted (index, name) of rotated logs written for path '''
+    pattern = re.compile(re.escape(path) + r'\.(\d+)\.gz$')
+    files = []
+    for name in glob.glob(glob.escape(path) + '.*.gz'):
+        m = pattern.match(name)
+        if m is not None:
+            files.append((int(m.group(1)), name))
+    return sorted(files)
+
+def read_log(path):
+    '''
+    yield (timestamp, text) records from a log file, stopping cleanly at a
+    truncated tail (e.g. the log of a recorder that was killed)
+    '''
+    with gzip.open(path, 'rb') as f:
+        while True:
+            try:
+                header = f.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    return
+                ts, length = HEADER.unpack(header)
+                data = f.read(length)
+            except (EOFError, zlib.error, gzip.BadGzipFile):
+                return
+            if len(data) < length:
+                return
+            yield ts, data.decode('utf8')
+
+def read_batch(records, n):
+    ''' return up to n records from a read_log generator '''
+    return list(islice(records, n))
@@ -0,0 +1,190 @@
+import base64
+import numpy as np
+
+# router status flags, each one is a bit in Relays.flags
+FLAGS = [
+    'Authority', 'BadExit', 'Exit', 'Fast', 'Guard', 'HSDir', 'MiddleOnly',
+    'NoEdConsensus', 'Running', 'Stable', 'StaleDesc', 'Sybil', 'V2Dir',
+    'Valid',
+]
+FLAG_BITS = {flag: 1 << i for i, flag in enumerate(FLAGS)}
+
+# consensus bandwidth-weights (out of 10000) used when none are given
+DEFAULT_WEIGHTS = {
+    'Wgg': 10000, 'Wgd': 10000,
+    'Wmg': 10000, 'Wmm': 10000, 'Wme': 10000, 'Wmd': 10000,
+    'Wee': 10000, 'Wed': 10000,
+}
+
+class Relays:
+
+    def __init__(self, fingerprints, nicknames, addresses, bandwidth, flags,
+            weights=None, families=None):
+        self.fingerprints = fingerprints
+        self.nicknames = nicknames
+        self.addresses = addresses
+        self.bandwidth = np.asarray(bandwidth, dtype=np.float64)
+        self.flags = np.asarray(flags, dtype=np.uint32)
+        self.weights = dict(DEFAULT_WEIGHTS)
+        if weights:
+            self.weights.update(weights)
+        self.subnet = np.fromiter(
+            (subnet_id(a) for a in addresses),
+            dtype=np.int64,
+            count=len(addresses),
+        )
+        self.family = family_ids(fingerprints, families or [])
+
+    @classmethod
+    def from_consensus(cls, text, families=None):
+        '''
+        create Relays from router status entries (GETINFO ns/all or a full
+        consensus, whose bandwidth-weights line is used if present)
+        families is an optional iterable of sets of fingerprints
+        '''
+        fingerprints = []
+        nicknames = []
+        addresses = []
+        bandwidth = []
+        flags = []
+        weights = None
+        for line in text.splitlines():
+            keyword, _, value = line.partition(' ')
+            if keyword == 'r':
+                parts = value.split(' ')
+                nicknames.append(parts[0])
+                fingerprints.append(decode_identity(parts[1]))
+                addresses.append(parts[5])
+                bandwidth.append(0)
+                flags.append(0)
+            elif keyword == 's' and flags:
+                bits = 0
+                for flag in value.split(' '):
+                    bits |= FLAG_BITS.get(flag, 0)
+                flags[-1] = bits
+            elif keyword == 'w' and bandwidth:
+                for item in value.split(' '):
+                    k, _, v = item.partition('=')
+                    if k == 'Bandwidth':
+                        bandwidth[-1] = int(v)
+            elif keyword == 'bandwidth-weights':
+                weights = {}
+                for item in value.split(' '):
+                    k, _, v = item.partition('=')
+                    weights[k] = int(v)
+        return cls(
+            fingerprints,
+            nicknames,
+            addresses,
+            bandwidth,
+            flags,
+            weights=weights,
+            families=families,
+        )
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+    def has(self, flag):
+        ''' boolean mask of relays with flag '''
+        return (self.flags & FLAG_BITS[flag]) != 0
+
+    def position_weights(self):
+        ''' return (guard, middle, exit) selection weight arrays '''
+        w = self.weights
+        usable = self.has('Running') & self.has('Valid')
+        guard = self.has('Guard')
+        exit = self.has('Exit') & ~self.has('BadExit')
+        middle_only = self.has('MiddleOnly')
+        both = guard & exit
+        bw = self.bandwidth * usable
+        g = bw * np.where(both, w['Wgd'], np.where(guard, w['Wgg'], 0))
+        g[middle_only] = 0
+        m = bw * np.select(
+            [both, guard, exit],
+            [w['Wmd'], w['Wmg'], w['Wme']],
+            w['Wmm'],
+        )
+        e = bw * np.where(both, w['Wed'], np.where(exit, w['Wee'], 0))
+        e[middle_only] = 0
+        return g, m, e
+
+    def paths(self, count, rng=None, max_tries=16):
+        '''
+        select count (guard, middle, exit) paths with weighted sampling,
+        relays in a path never share a /16 or family (which includes being
+        the same relay), paths still conflicting after max_tries resamples
+        are dropped, returns lists of fingerprints for EXTENDCIRCUIT
+        '''
+        if rng is None:
+            rng = np.random.default_rng()
+        g, m, e = self.position_weights()
+        exits = sample(rng, e, count)
+        guards = sample(rng, g, count)
+        for _ in range(max_tries):
+            bad = self.conflicts(guards, exits)
+            if not bad.any():
+                break
+            guards[bad] = sample(rng, g, int(bad.sum()))
+        ok = ~self.conflicts(guards, exits)
+        middles = sample(rng, m, count)
+        for _ in range(max_tries):
+            bad = self.conflicts(middles, guards)
+            bad |= self.conflicts(middles, exits)
+            if not bad.any():
+                break
+            middles[bad] = sample(rng, m, int(bad.sum()))
+        ok &= ~self.conflicts(middles, guards)
+        ok &= ~self.conflicts(middles, exits)
+        fingerprints = self.fingerprints
+        return [
+            [fingerprints[a], fingerprints[b], fingerprints[c]]
+            for a, b, c in zip(guards[ok], middles[ok], exits[ok])
+        ]
+
+    def conflicts(self, a, b):
+        ''' mask of index pairs in the same /16 or family '''
+        same_subnet = self.subnet[a] == self.subnet[b]
+        same_family = self.family[a] == self.family[b]
+        return same_subnet | same_family
+
+
+def sample(rng, weights, count):
+    ''' sample count relay indexes proportional to weights '''
+    total = weights.sum()
+    if total <= 0:
+        raise Exception('no relays available for position')
+    return rng.choice(len(weights), size=count, p=weights / total)
+
+def decode_identity(identity):
+    ''' convert base64 identity digest to $HEX fingerprint '''
+    b = base64.b64decode(identity + '=' * (-len(identity) % 4))
+    return '$' + b.hex().upper()
+
+def subnet_id(address):
+    ''' integer id of the IPv4 /16 containing address '''
+    a, b, _ = address.split('.', maxsplit=2)
+    return (int(a) << 8) | int(b)
+
+def family_ids(fingerprints, families):
+    ''' return array mapping each relay to a family id (union-find) '''
+    index = {fp.lstrip('$').upper(): i for i, fp in enumerate(fingerprints)}
+    parent = list(range(len(fingerprints)))
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    for family in families:
+        members = []
+        for fp in family:
+            fp = fp.lstrip('$').upper()
+            if fp in index:
+                members.append(index[fp])
+        for i in members[1:]:
+            parent[find(i)] = find(members[0])
+    return np.fromiter(
+        (find(i) for i in range(len(parent))),
+        dtype=np.int64,
+        count=len(parent),
+    )
@@ -1,4 +1,5 @@
 import asyncio
+from collections import deque
 from .events import EVENT_TYPES
 
 class Parser:
@@ -124,15 +125,52 @@ def parse_keywords(text):
     p.parse_keywords(text)
     return p.kwargs
 
+def parse_event(text):
+    ''' parse 650 event text and return Event object (or None if unknown) '''
+    if text.startswith('+'):
+        # multiline event, data follows the first line and is passed to the
+        # Event as its last positional argument
+        text, _, data = text[1:].partition('\r\n')
+        args, kwargs = parse(text)
+        args.append(unescape_data(data))
+    else:
+        args, kwargs = parse(text)
+    type, args = args[0], args[1:]
+    if type not in EVENT_TYPES:
+        return None
+    return EVENT_TYPES[type](*args, **kwargs)
+
+def unescape_data(data):
+    ''' strip terminating "." line and undo dot-escaping of a data block '''
+    lines = data.split('\r\n')
+    if lines[-1] == '':
+        lines.pop()
+    if lines and lines[-1] == '.':
+        lines.pop()
+    return '\n'.join(l[1:] if l.startswith('.') else l for l in lines)
+
+def retrieve_exception(task):
+    ''' mark a background task's exception as retrieved '''
+    if not task.cancelled():
+        task.exception()
+
 
 class TextProtocol:
 
-    def __init__(self, r, w, event_queue=None):
+    def __init__(self, r, w, event_queue=None, high_water=64 * 1024):
         self.r = r
         self.w = w
-        self.response_queue = asyncio.Queue()
         self.event_queue = event_queue
-        self.lock = asyncio.Lock()
+        self.recorder = None
+        # only drain when the transport buffers more than this many bytes
+        self.high_water = high_water
+        # response futures in the order their commands were written
+        self.__pending = deque()
+        # encoded commands waiting for the next flush
+        self.__buffer = []
+        self.__flush_scheduled = False
+        # drain started by a flush that went over high_water
+        self.__drain = None
         self.task = asyncio.create_task(self.__loop())
 
     async def __loop(self):
@@ -140,28 +178,55 @@ class TextProtocol:
         while True:
             resp = await self.__read()
             if resp['status'] == 650:
+                if self.recorder is not None:
+                    self.recorder.record(' '.join(resp['lines']))
                 await self.__put_event(resp)
-            else:
-                await self.response_queue.put(resp)
+            elif self.__pending:
+                future = self.__pending.popleft()
+                if not future.done():
+                    future.set_result(resp)
 
     async def __put_event(self, resp):
         ''' parse and queue an event from a resp object '''
         if self.event_queue is None:
             return
-        args, kwargs = parse(' '.join(resp['lines']))
-        type, args = args[0], args[1:]
-        if type in EVENT_TYPES:
-            event = EVENT_TYPES[type](*args, **kwargs)
+        event = parse_event(' '.join(resp['lines']))
+        if event is not None:
             await self.event_queue.put(event)
 
-    async def __write(self, cmd):
-        ''' writes a command '''
-        self.w.write(cmd.encode('utf8') + b'\r\n')
-        await self.w.drain()
+    def __write(self, cmd):
+        ''' buffer a command, written with the others from this loop tick '''
+        self.__buffer.append(cmd.encode('utf8') + b'\r\n')
+        if not self.__flush_scheduled:
+            self.__flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self.__flush)
+
+    def __flush(self):
+        ''' write all buffered commands at once '''
+        self.__flush_scheduled = False
+        buffer = self.__buffer
+        self.__buffer = []
+        try:
+            self.w.write(b''.join(buffer))
+        except Exception as e:
+            # connection is unusable, fail every waiting command
+            pending = self.__pending
+            self.__pending = deque()
+            for future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        if self.w.transport.get_write_buffer_size() > self.high_water:
+            if self.__drain is None or self.__drain.done():
+                # shared by every command issued until the buffer drains
+                self.__drain = asyncio.ensure_future(self.w.drain())
+                self.__drain.add_done_callback(retrieve_exception)
 
     async def __read(self):
         ''' reads a response '''
         lines = []
+        # status code of each line (replies like MAPADDRESS mix them)
+        statuses = []
         status = -1
         while True:
             line = await self.r.readline()
@@ -183,17 +248,22 @@ class TextProtocol:
                     if line == b'.\r\n':
                         break
                 lines.append(data.decode('utf8'))
+                statuses.append(status)
                 continue
             lines.append(line[4:].decode('utf8').strip())
+            statuses.append(status)
             # if not multiline response, exit
             if line[3:4] != b'-':
                 break
-        return {'status': status, 'lines': lines}
+        return {'status': status, 'lines': lines, 'statuses': statuses}
 
     async def cmd(self, cmd):
         ''' send a command and return response object '''
-        async with self.lock:
-            await self.__write(cmd)
-            resp = await self.response_queue.get()
-            self.response_queue.task_done()
-            return resp
+        drain = self.__drain
+        if drain is not None and not drain.done():
+            # an earlier flush went over high_water, wait for it to drain
+            await asyncio.shield(drain)
+        future = asyncio.get_running_loop().create_future()
+        self.__pending.append(future)
+        self.__write(cmd)
+        return await future
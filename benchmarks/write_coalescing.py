@@ -0,0 +1,126 @@
+'''
+Benchmark of command write coalescing against a fake control server.
+
+Every mode issues the same burst of commands at once (asyncio.gather):
+
+  legacy      the old write path: a lock held for the whole round trip, one
+              write and one drain per command
+  pipelined   no lock (responses matched in order) but still one write and
+              one drain per command, isolates the effect of pipelining
+  coalesced   TextProtocol: commands from the same loop tick share a single
+              write, drain only above the high-water mark
+
+Client writes and server reads approximate the send and receive syscalls.
+'''
+
+import aiotor
+import asyncio
+from collections import deque
+import sys
+import time
+
+COMMANDS = 10000
+
+class FakeControlServer:
+
+    def __init__(self):
+        self.reads = 0
+
+    async def handle(self, r, w):
+        while True:
+            data = await r.read(65536)
+            if not data:
+                break
+            self.reads += 1
+            n = data.count(b'\r\n')
+            w.write(b'250-version=0.4.8.0\r\n250 OK\r\n' * n)
+            await w.drain()
+        w.close()
+
+
+class WriteCounter:
+    ''' StreamWriter wrapper counting write calls '''
+
+    def __init__(self, w):
+        self.w = w
+        self.transport = w.transport
+        self.writes = 0
+
+    def write(self, data):
+        self.writes += 1
+        self.w.write(data)
+
+    async def drain(self):
+        await self.w.drain()
+
+
+class LegacyProtocol:
+    ''' write-per-command client, optionally pipelined instead of locked '''
+
+    def __init__(self, r, w, pipelined=False):
+        self.r = r
+        self.w = w
+        self.lock = None if pipelined else asyncio.Lock()
+        self.pending = deque()
+        self.task = asyncio.create_task(self.loop())
+
+    async def loop(self):
+        while True:
+            line = await self.r.readline()
+            if line[3:4] == b' ':
+                self.pending.popleft().set_result(line)
+
+    async def cmd(self, cmd):
+        if self.lock is None:
+            return await self.send(cmd)
+        async with self.lock:
+            return await self.send(cmd)
+
+    async def send(self, cmd):
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append(future)
+        self.w.write(cmd.encode('utf8') + b'\r\n')
+        await self.w.drain()
+        return await future
+
+
+async def run(mode):
+    server = FakeControlServer()
+    s = await asyncio.start_server(server.handle, '127.0.0.1', 0)
+    port = s.sockets[0].getsockname()[1]
+    r, w = await asyncio.open_connection('127.0.0.1', port)
+    counter = WriteCounter(w)
+    if mode == 'coalesced':
+        io = aiotor.textprotocol.TextProtocol(r, counter)
+    else:
+        io = LegacyProtocol(r, counter, pipelined=(mode == 'pipelined'))
+    start = time.perf_counter()
+    await asyncio.gather(*(io.cmd('GETINFO version') for _ in range(COMMANDS)))
+    elapsed = time.perf_counter() - start
+    line = '{:>10}: {} commands, {} client writes, {} server reads, ' \
+        '{:.3f}s ({:.1f}us/cmd)'
+    print(line.format(
+        mode,
+        COMMANDS,
+        counter.writes,
+        server.reads,
+        elapsed,
+        elapsed / COMMANDS * 1e6,
+    ))
+    io.task.cancel()
+    w.close()
+    await w.wait_closed()
+    s.close()
+    await s.wait_closed()
+
+async def main():
+    await run('legacy')
+    await run('pipelined')
+    await run('coalesced')
+
+# ugh, windows
+if sys.platform == 'win32':
+    elp = asyncio.WindowsSelectorEventLoopPolicy()
+    asyncio.set_event_loop_policy(elp)
+
+asyncio.run(main())
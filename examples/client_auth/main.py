@@ -0,0 +1,36 @@
+'''
+Example of creating an onion service that requires client authorization and
+adding the client credentials for it to the same Tor instance.
+'''
+
+import aiotor
+from aiotor.onions import generate_client_keys
+import asyncio
+import sys
+
+async def main():
+    # connect to tor controller and authenticate
+    # 9151 is Tor Browser control port
+    c = aiotor.Controller(host='127.0.0.1', port=9151)
+    await c.connect()
+    await c.authenticate()
+    # generate client keys without blocking the event loop
+    keys = await generate_client_keys(100)
+    # create an onion that only these clients can connect to
+    onion = aiotor.onions.Onion()
+    onion.ports[80] = '127.0.0.1:8666'
+    for key in keys:
+        onion.add_client(key)
+    await c.onions.add(onion)
+    print('added {}.onion with {} clients'.format(onion.id, len(keys)))
+    # act as the first client by adding its credentials
+    await c.onions.add_client_auths({onion.id: keys[0]})
+    clients = await c.onions.view_client_auth(onion.id)
+    print('client credentials for:', ', '.join(clients))
+
+# ugh, windows
+if sys.platform == 'win32':
+    elp = asyncio.WindowsSelectorEventLoopPolicy()
+    asyncio.set_event_loop_policy(elp)
+
+asyncio.run(main())
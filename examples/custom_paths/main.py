@@ -0,0 +1,32 @@
+'''
+Example of selecting custom circuit paths from the consensus and building
+circuits along them with EXTENDCIRCUIT (requires numpy).
+'''
+
+import aiotor
+from aiotor.relays import Relays
+import asyncio
+import sys
+
+async def main():
+    # connect to tor controller and authenticate
+    # 9151 is Tor Browser control port
+    c = aiotor.Controller(host='127.0.0.1', port=9151)
+    await c.connect()
+    await c.authenticate()
+    # load router status entries for every relay
+    relays = Relays.from_consensus(await c.get_info('ns/all'))
+    print('loaded {} relays'.format(len(relays)))
+    # pick 1000 guard, middle, exit paths at once
+    paths = relays.paths(1000)
+    # build circuits for the first few paths
+    for path in paths[:5]:
+        circuit_id = await c.extend_circuit(path)
+        print('circuit {}: {}'.format(circuit_id, ' -> '.join(path)))
+
+# ugh, windows
+if sys.platform == 'win32':
+    elp = asyncio.WindowsSelectorEventLoopPolicy()
+    asyncio.set_event_loop_policy(elp)
+
+asyncio.run(main())
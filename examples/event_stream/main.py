@@ -0,0 +1,33 @@
+'''
+Example of consuming high-rate events in batches using events.stream()
+'''
+
+import aiotor
+import asyncio
+import sys
+
+async def main():
+    # connect to tor controller and authenticate
+    # 9151 is Tor Browser control port
+    c = aiotor.Controller(host='127.0.0.1', port=9151)
+    await c.connect()
+    await c.authenticate()
+    # receive up to 500 STREAM_BW events at a time, waiting at most 50ms
+    # for a batch to fill (SETEVENTS is sent on enter and exit)
+    stream = c.events.stream('STREAM_BW', max_batch=500, max_delay=0.05)
+    async with stream:
+        async for batch in stream:
+            read = sum(int(e.read) for e in batch)
+            written = sum(int(e.written) for e in batch)
+            print('{} events: read={}, written={}'.format(
+                len(batch),
+                read,
+                written,
+            ))
+
+# ugh, windows
+if sys.platform == 'win32':
+    elp = asyncio.WindowsSelectorEventLoopPolicy()
+    asyncio.set_event_loop_policy(elp)
+
+asyncio.run(main())
@@ -0,0 +1,38 @@
+'''
+Example of recording raw events to a rotating compressed log and replaying
+them back through events at ten times the original speed.
+'''
+
+import aiotor
+from aiotor.recorder import Recorder, Replayer
+import asyncio
+import sys
+
+EVENTS = ['CIRC', 'STREAM', 'STREAM_BW', 'HS_DESC']
+
+# event handler to display replayed circuit changes
+async def circ_event(e):
+    print('Circuit: id={}, status={}, path={}'.format(e.id, e.status, e.path))
+
+async def main():
+    # connect to tor controller and authenticate
+    # 9151 is Tor Browser control port
+    c = aiotor.Controller(host='127.0.0.1', port=9151)
+    await c.connect()
+    await c.authenticate()
+    # record events for one minute to events.log.000001.gz, ...
+    recorder = Recorder('events.log')
+    await recorder.start(c, EVENTS)
+    await asyncio.sleep(60)
+    await recorder.stop(EVENTS)
+    # replay recorded circuit events
+    await c.events.add('CIRC', circ_event)
+    replayer = Replayer.from_prefix('events.log')
+    await replayer.replay(c.events, speed=10)
+
+# ugh, windows
+if sys.platform == 'win32':
+    elp = asyncio.WindowsSelectorEventLoopPolicy()
+    asyncio.set_event_loop_policy(elp)
+
+asyncio.run(main())
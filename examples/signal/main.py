@@ -15,6 +15,11 @@ async def main():
     # send NEWNYM signal to make Tor use fresh circuits for future
     # connections instead of reusing existing ones.
     await c.signal('NEWNYM')
+    # or let the identity service coalesce concurrent NEWNYM requests and
+    # wait until tor has actually switched to a new identity (tor applies at
+    # most one NEWNYM every 10 seconds).
+    await asyncio.gather(*(c.identity.rotate() for _ in range(10)))
+    print('new identity')
 
 # ugh, windows
 if sys.platform == 'win32':
@@ -14,6 +14,7 @@ setuptools.setup(
     url="https://github.com/wybiral/aiotor",
     packages=['aiotor'],
     install_requires=['cryptography'],
+    extras_require={'numpy': ['numpy']},
     license='MIT',
     classifiers=[
         "Programming Language :: Python :: 3",